@@ -3,19 +3,60 @@ Flash API that Receives PDFs → Generates cheat sheet → Returns PDF
 """
 
 import os
-import io
+import queue
+import atexit
+import hashlib
 import logging
-from flask import Flask, request, send_file, jsonify
+import tempfile
+from logging.handlers import QueueHandler, QueueListener
+from flask import Flask, request, send_file, jsonify, after_this_request
 from flask_cors import CORS
-from werkzeug.utils import secure_filename
 from .cheatsheet_pipeline import generate_cheatsheet
+from .latex import InvalidPdfError, build_preamble_format, warm_tectonic_cache
+
+# Configure logging for gunicorn. Request threads only enqueue records; a
+# background listener thread does the blocking writes to stderr.
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+_log_listener = None
+
+
+def _start_log_listener():
+    """Route root logging through a fresh queue and listener thread"""
+    global _log_listener
+
+    log_queue = queue.Queue(-1)
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, QueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+
+    _log_listener = QueueListener(log_queue, _log_stream_handler, respect_handler_level=True)
+    _log_listener.start()
+
+
+def _stop_log_listener():
+    """Flush queued records on shutdown"""
+    if _log_listener is not None:
+        _log_listener.stop()
+
+
+logging.getLogger().setLevel(logging.INFO)
+_start_log_listener()
+# Threads don't survive fork(), so forked gunicorn workers need their own listener
+os.register_at_fork(after_in_child=_start_log_listener)
+atexit.register(_stop_log_listener)
 
-# Configure logging for gunicorn
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+# Precompile the cheat-sheet preamble (and fetch tectonic's packages, if it is
+# installed) once at startup instead of on the first request
+build_preamble_format()
+warm_tectonic_cache()
+
 # Configure CORS to only allow requests from your frontend
 # Add your Vercel URL to ALLOWED_ORIGINS environment variable in Railway
 ALLOWED_ORIGINS = os.getenv(
@@ -34,18 +75,24 @@ CORS(app, resources={
 # Security Configuration
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB per file
 MAX_FILES = 10  # Maximum 10 files per request
-ALLOWED_EXTENSIONS = {'pdf'}
+MAX_REQUEST_SIZE = MAX_FILES * MAX_FILE_SIZE
+
+# Uploads are streamed to named temp files on disk, so they never sit in RAM and
+# render workers can open them by path
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Leading bytes of each upload used for the magic-byte check and its log label
+UPLOAD_HEADER_SIZE = 4096
 
 
 def allowed_file(filename):
     """Check if filename has allowed extension"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return filename.lower().endswith('.pdf')
 
 
 def validate_pdf_content(pdf_bytes):
-    """Verify file is actually a PDF by checking magic bytes"""
-    header = pdf_bytes[:1024]
-    return b'%PDF' in header
+    """Verify file is actually a PDF by checking magic bytes in the first 1KB"""
+    return pdf_bytes.find(b'%PDF', 0, 1024) != -1
 
 
 @app.route('/api/generate', methods=['POST'])
@@ -53,6 +100,11 @@ def generate():
 
     #Receive PDFs, return cheat sheet
 
+    # Validate: Reject oversized uploads before Werkzeug parses the multipart body
+    if request.content_length and request.content_length > MAX_REQUEST_SIZE:
+        logger.error(f"VALIDATION FAILED: Payload too large ({request.content_length} bytes)")
+        return jsonify({'error': 'Payload too large'}), 413
+
     logger.info(f"REQUEST: Method={request.method}, Content-Type={request.content_type}")
     logger.info(f"REQUEST: Files keys={list(request.files.keys())}")
 
@@ -70,6 +122,7 @@ def generate():
 
     pdf_files = []
     filenames = []
+    labels = []
 
     for file in files:
         # Validate: Check if filename exists
@@ -77,40 +130,50 @@ def generate():
             logger.error("VALIDATION FAILED: File has no filename")
             return jsonify({'error': 'File has no name'}), 400
 
-        logger.info(f"VALIDATION PASSED: Filename = {file.filename}")
+        logger.debug("VALIDATION PASSED: Filename = %s", file.filename)
 
         # Validate: Check file extension
         if not allowed_file(file.filename):
             logger.error(f"VALIDATION FAILED: Invalid extension for {file.filename}")
             return jsonify({'error': f'Invalid file type: {file.filename}. Only PDF files allowed.'}), 400
 
-        logger.info(f"VALIDATION PASSED: File extension OK for {file.filename}")
+        logger.debug("VALIDATION PASSED: File extension OK for %s", file.filename)
 
-        # Sanitize filename (removes dangerous characters like ../)
-        safe_filename = secure_filename(file.filename)
-        logger.info(f"VALIDATION: Sanitized filename = {safe_filename}")
+        # Label the file by a hash of its first bytes for logging. The client-supplied
+        # name is only given to Gemini as context, never used as a path.
+        header = file.stream.read(UPLOAD_HEADER_SIZE)
+        label = hashlib.blake2b(header, digest_size=8).hexdigest()
+        logger.debug("VALIDATION: File %s labelled %s", file.filename, label)
 
-        # Validate: Check file size and read content
-        pdf_bytes = file.read(MAX_FILE_SIZE + 1)
-        logger.info(f"VALIDATION: Read {len(pdf_bytes)} bytes from {safe_filename}")
+        # Validate: Verify it's actually a PDF (not renamed .exe, etc.)
+        if not validate_pdf_content(header):
+            logger.error(f"VALIDATION FAILED: Invalid PDF magic bytes for {label}")
+            return jsonify({'error': f'Invalid PDF file: {file.filename}'}), 400
 
-        if len(pdf_bytes) > MAX_FILE_SIZE:
-            logger.error(f"VALIDATION FAILED: File too large: {safe_filename} ({len(pdf_bytes)} bytes)")
-            return jsonify({'error': f'File too large: {safe_filename}. Maximum size is 50MB.'}), 400
+        logger.debug("VALIDATION PASSED: PDF magic bytes OK for %s", label)
 
-        logger.info(f"VALIDATION PASSED: File size OK for {safe_filename}")
+        # Validate: Check file size while streaming content to a temp file
+        spool = tempfile.NamedTemporaryFile(suffix='.pdf')
+        spool.write(header)
+        total = len(header)
 
-        # Validate: Verify it's actually a PDF (not renamed .exe, etc.)
-        if not validate_pdf_content(pdf_bytes):
-            logger.error(f"VALIDATION FAILED: Invalid PDF magic bytes for {safe_filename}")
-            return jsonify({'error': f'Invalid PDF file: {safe_filename}'}), 400
+        while chunk := file.stream.read(UPLOAD_CHUNK_SIZE):
+            total += len(chunk)
+            if total > MAX_FILE_SIZE:
+                spool.close()
+                logger.error(f"VALIDATION FAILED: File too large: {label} (over {MAX_FILE_SIZE} bytes)")
+                return jsonify({'error': f'File too large: {file.filename}. Maximum size is 50MB.'}), 400
+            spool.write(chunk)
 
-        logger.info(f"VALIDATION PASSED: PDF magic bytes OK for {safe_filename}")
+        spool.seek(0)
+        logger.debug("VALIDATION: Read %d bytes from %s", total, label)
+        logger.debug("VALIDATION PASSED: File size OK for %s", label)
 
-        pdf_files.append(pdf_bytes)
-        filenames.append(safe_filename)
+        pdf_files.append(spool)
+        filenames.append(file.filename)
+        labels.append(label)
 
-    logger.info(f"VALIDATION COMPLETE: Received {len(pdf_files)} PDF file(s): {filenames}")
+    logger.info(f"VALIDATION COMPLETE: Received {len(pdf_files)} PDF file(s): {labels}")
 
     api_key = os.getenv('GEMINI_API_KEY')
 
@@ -128,9 +191,16 @@ def generate():
             api_key=api_key
         )
         logger.info("PIPELINE: generate_cheatsheet() completed")
+    except InvalidPdfError as e:
+        # The error names the server-side temp file, so keep it out of the response
+        logger.error(f"PIPELINE ERROR: Could not open an uploaded PDF: {str(e)}")
+        return jsonify({'error': 'Invalid or corrupt PDF'}), 400
     except Exception as e:
         logger.error(f"PIPELINE ERROR: Exception in generate_cheatsheet(): {str(e)}")
         return jsonify({'error': f'Pipeline error: {str(e)}'}), 500
+    finally:
+        for spool in pdf_files:
+            spool.close()
 
     # Check if generation succeeded
     if not result['success']:
@@ -140,18 +210,30 @@ def generate():
 
     logger.info("PIPELINE SUCCESS: Cheat sheet generation succeeded")
 
-    # Return the PDF file to frontend
-    if result['pdf_bytes']:
-        pdf_size = len(result['pdf_bytes'])
+    # Return the PDF file to frontend straight from disk
+    pdf_path = result['pdf_path']
+    if pdf_path:
+        pdf_size = os.path.getsize(pdf_path)
         logger.info(f"RESPONSE: Sending PDF to frontend ({pdf_size} bytes)")
+
+        @after_this_request
+        def remove_pdf(response):
+            # send_file() already holds the file open, so it can be unlinked now
+            try:
+                os.unlink(pdf_path)
+            except OSError as e:
+                logger.warning(f"RESPONSE: Could not remove temp PDF {pdf_path}: {e}")
+            return response
+
+        # Stream the file from disk rather than loading it into memory
         return send_file(
-            io.BytesIO(result['pdf_bytes']),
+            pdf_path,
             mimetype='application/pdf',
             as_attachment=True,
             download_name='cramify-cheatsheet.pdf'
         )
     else:
-        logger.error("RESPONSE ERROR: No PDF bytes in result")
+        logger.error("RESPONSE ERROR: No PDF path in result")
         return jsonify({'error': 'No PDF generated'}), 500
 
 
@@ -162,11 +244,3 @@ def health():
         'status': 'ok'
     })
 
-
-if __name__ == '__main__':
-    port = int(os.getenv('PORT', 5001))
-    print("Cramify API Server")
-    print(f"   Starting on http://0.0.0.0:{port}")
-    print()
-
-    app.run(host='0.0.0.0', port=port, debug=False)
@@ -3,21 +3,38 @@ Cramify LaTeX Pipeline - Streamlined 2-Page Cheat Sheet Generator
 
 This module orchestrates the complete pipeline:
   1. Convert PDFs to images
-  2. Send to Gemini for LaTeX generation (targeting ~3 pages)
+  2. Send to Gemini for LaTeX generation (one call per PDF, merged; targeting ~3 pages)
   3. Compile and check page count
   4. Condense to exactly 2 pages if needed
 """
 
 import os
 import sys
+import json
 import time
+import queue
+import hashlib
+import shutil
+import tempfile
+import threading
+import multiprocessing
 import logging
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack, closing
 from pathlib import Path
-from typing import List, Dict
+from typing import Iterator, List, Dict, Optional, Tuple, Union
 
 from .latex import (
-    pdf_to_images,
+    PdfSource,
+    cache_get,
+    cache_put,
+    iter_document_images,
+    open_pdf,
+    pdf_digest,
+    render_pages,
     gemini_generate_latex,
+    merge_latex_fragments,
     condense_to_two_pages,
     compile_latex,
     fix_latex_errors,
@@ -28,9 +45,366 @@ logger = logging.getLogger(__name__)
 # Configuration
 API_KEY = os.getenv('GEMINI_API_KEY', '')
 
+# Rasterization is CPU-bound, so pages are rendered in parallel processes.
+# Capped at the API's file limit to avoid oversubscribing gunicorn hosts.
+# All requests in a process share one pool, so the cap is per process.
+MAX_RENDER_WORKERS = min(10, os.cpu_count() or 1)
+
+# PDFs this short render in one piece; splitting costs more than it saves
+MAX_UNSPLIT_PAGES = 2
+
+# gunicorn's gthread workers are multi-threaded, and fork()ing a threaded
+# process can deadlock the child on locks held by other threads, so render
+# workers are forked from a clean single-threaded server instead
+RENDER_MP_CONTEXT = multiprocessing.get_context('forkserver')
+# Import PyMuPDF once in the fork server rather than in every render worker.
+# pdf_processing sits outside app.latex so this doesn't also import the Gemini
+# client and LaTeX compiler (and run their import-time setup).
+RENDER_MP_CONTEXT.set_forkserver_preload(['app.pdf_processing'])
+
+_render_pool: Optional[ProcessPoolExecutor] = None
+_render_pool_pid: Optional[int] = None
+_render_pool_lock = threading.Lock()
+
+# Rendered pages waiting to be uploaded to Gemini (bounds the working set)
+PAGE_QUEUE_SIZE = 4
+
+# Gemini gets this many chances to fix LaTeX that fails to compile
+MAX_FIX_RETRIES = 3
+
+# LaTeX that compiled successfully, keyed by the content hash of the input PDFs
+LATEX_CACHE_DIR = Path(tempfile.gettempdir()) / 'cramify-cache'
+LATEX_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Marks the end of the page stream handed to the Gemini consumer
+_END_OF_PAGES = object()
+
+
+def _page_ranges(page_count: int, parts: int) -> List[range]:
+    """Split a PDF's pages into at most `parts` contiguous, similar-sized ranges."""
+    if page_count <= MAX_UNSPLIT_PAGES or parts <= 1:
+        return [range(page_count)]
+    size = -(-page_count // min(parts, page_count))  # Ceiling division
+    return [range(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+
+def _get_render_pool() -> ProcessPoolExecutor:
+    """This process's shared render pool, created on first use (after any fork)."""
+    global _render_pool, _render_pool_pid
+
+    with _render_pool_lock:
+        if _render_pool is None or _render_pool_pid != os.getpid():
+            _render_pool = ProcessPoolExecutor(max_workers=MAX_RENDER_WORKERS, mp_context=RENDER_MP_CONTEXT)
+            _render_pool_pid = os.getpid()
+        return _render_pool
+
+
+def _discard_render_pool(pool: ProcessPoolExecutor) -> None:
+    """Drop a broken render pool so the next request starts a fresh one."""
+    global _render_pool
+
+    with _render_pool_lock:
+        if _render_pool is pool:
+            _render_pool = None
+    pool.shutdown(wait=False)
+
+
+def _pdf_location(pdf_source: PdfSource, stack: ExitStack) -> Union[bytes, str, Path]:
+    """
+    Get a picklable handle on a PDF without reading it into memory.
+
+    Bytes and paths are returned as they are. A file object backed by a
+    file on disk is used by name; any other is copied to a temp file that
+    lives as long as `stack`.
+    """
+    if isinstance(pdf_source, (bytes, bytearray, str, Path)):
+        return pdf_source
+
+    name = getattr(pdf_source, 'name', None)
+    if isinstance(name, str) and os.path.isfile(name):
+        pdf_source.flush()
+        return name
+
+    copy = stack.enter_context(tempfile.NamedTemporaryFile(suffix='.pdf'))
+    pdf_source.seek(0)
+    shutil.copyfileobj(pdf_source, copy)
+    copy.flush()
+    return copy.name
+
+
+def _render_pdfs(pdf_files: List[PdfSource]) -> Iterator[Tuple[int, bytes]]:
+    """Yield (pdf index, page image) for all PDFs, in input order."""
+    with ExitStack() as temp_files:
+        # Workers need picklable input, so hand them paths (or the original bytes)
+        locations = [_pdf_location(pdf_source, temp_files) for pdf_source in pdf_files]
+
+        with ExitStack() as open_docs:
+            # One parse per PDF gives the page count and, when rendering inline, the pages
+            docs = [open_docs.enter_context(open_pdf(location)) for location in locations]
+            page_counts = [doc.page_count for doc in docs]
+
+            # Split PDFs into page ranges so a few long PDFs still keep every worker busy
+            parts_per_pdf = max(1, MAX_RENDER_WORKERS // len(pdf_files))
+            tasks = [
+                (i, pages)
+                for i, page_count in enumerate(page_counts)
+                for pages in _page_ranges(page_count, parts_per_pdf)
+            ]
+
+            if len(tasks) <= 1 or MAX_RENDER_WORKERS <= 1:
+                # A single short PDF streams page by page without paying for pool startup
+                for i, doc in enumerate(docs):
+                    for image in iter_document_images(doc):
+                        yield i, image
+                    logger.info(f"STAGE 1: PDF {i+1}/{len(pdf_files)} converted to {page_counts[i]} pages")
+                return
+
+        # Each worker opens its own copy of the document. Closing the results
+        # early (e.g. a failed shard) cancels this request's unstarted tasks.
+        pool = _get_render_pool()
+        try:
+            with closing(pool.map(
+                render_pages,
+                [locations[i] for i, _ in tasks],
+                [pages for _, pages in tasks]
+            )) as results:
+                for (i, pages), images in zip(tasks, results):
+                    for image in images:
+                        yield i, image
+                    if pages.stop == page_counts[i]:
+                        logger.info(f"STAGE 1: PDF {i+1}/{len(pdf_files)} converted to {page_counts[i]} pages")
+        except BrokenProcessPool:
+            # A render worker died (e.g. PyMuPDF crashed on a malformed PDF)
+            _discard_render_pool(pool)
+            raise
+
+
+def _drain_pages(page_queue: queue.Queue) -> Iterator[bytes]:
+    """Yield page images from the queue until the producer signals the end."""
+    while True:
+        item = page_queue.get()
+        if item is _END_OF_PAGES:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+def _put_page(page_queue: queue.Queue, item, consumer: Future) -> bool:
+    """Queue an item for the Gemini consumer. Returns False if it already stopped."""
+    while True:
+        try:
+            page_queue.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            if consumer.done():
+                return False
+
+
+def _render_and_generate(
+    pdf_files: List[PdfSource],
+    filenames: List[str],
+    api_key: str
+) -> Tuple[Optional[str], int]:
+    """
+    Stages 1 + 2: render PDF pages and have Gemini generate LaTeX from them.
+
+    The stages overlap: each PDF gets its own background thread (a "shard")
+    that uploads its rendered pages to Gemini while later pages are still
+    rendering, then generates LaTeX for that PDF alone. With several PDFs
+    the shards run in parallel and a final Gemini call merges their output.
+
+    Returns:
+        (LaTeX source or None if a Gemini call failed, total page count)
+    """
+    logger.info(f"STAGE 1 START: Converting {len(pdf_files)} PDFs to images...")
+
+    page_queues = [queue.Queue(maxsize=PAGE_QUEUE_SIZE) for _ in pdf_files]
+    shards: List[Optional[Future]] = [None] * len(pdf_files)
+    page_count = 0
+
+    with ThreadPoolExecutor(max_workers=len(pdf_files)) as gemini_executor:
+        logger.info(f"STAGE 2 START: Streaming pages to {len(pdf_files)} Gemini shard(s)")
+
+        end_of_pages = _END_OF_PAGES
+        try:
+            with closing(_render_pdfs(pdf_files)) as pages:
+                for i, image in pages:
+                    if shards[i] is None:
+                        # Pages arrive in input order, so every earlier PDF is fully
+                        # counted and the shard can number its pages across all PDFs
+                        shards[i] = gemini_executor.submit(
+                            gemini_generate_latex,
+                            _drain_pages(page_queues[i]),
+                            [filenames[i]],
+                            api_key,
+                            page_count + 1
+                        )
+                    if not _put_page(page_queues[i], image, shards[i]):
+                        # One failed shard fails the stage; stop the others too
+                        end_of_pages = RuntimeError(f"Gemini shard {i+1} stopped early")
+                        break
+                    page_count += 1
+        except Exception as e:
+            # Abort the shards so none calls Gemini with partial input
+            end_of_pages = e
+            raise
+        finally:
+            for page_queue, shard in zip(page_queues, shards):
+                if shard is not None:
+                    _put_page(page_queue, end_of_pages, shard)
+
+        logger.info(f"STAGE 1 COMPLETE: Converted {page_count} total pages from {len(pdf_files)} PDFs")
+
+    # Stage 2: One Gemini call per PDF, then merge the results
+    try:
+        fragments = [shard.result() for shard in shards if shard is not None]
+        if len(fragments) == 1:
+            latex_source = fragments[0]
+        else:
+            logger.info(f"STAGE 2: Merging {len(fragments)} shard outputs")
+            latex_source = merge_latex_fragments(fragments, api_key)
+        logger.info(f"STAGE 2 COMPLETE: Received {len(latex_source)} characters of LaTeX")
+    except Exception as e:
+        logger.error(f"STAGE 2 FAILED")
+        return None, page_count
+
+    return latex_source, page_count
+
+
+def _latex_cache_key(pdf_files: List[PdfSource]) -> str:
+    """Cache key for a set of PDFs, independent of upload order."""
+    digests = sorted(pdf_digest(pdf_source) for pdf_source in pdf_files)
+    return hashlib.sha256(b''.join(digests)).hexdigest()
+
+
+def _load_cached_latex(cache_key: str) -> Optional[Tuple[str, int]]:
+    """Look up (latex_source, total_pages) from a previous successful run."""
+    try:
+        data = cache_get(LATEX_CACHE_DIR, cache_key)
+    except OSError as e:
+        logger.warning(f"CACHE: Could not read LaTeX cache: {e}")
+        return None
+
+    if data is None:
+        return None
+
+    entry = json.loads(data)
+    return entry["latex_source"], entry["total_pages"]
+
+
+def _store_cached_latex(cache_key: str, latex_source: str, page_count: int) -> None:
+    """Remember LaTeX that compiled successfully for these PDFs."""
+    data = json.dumps({"latex_source": latex_source, "total_pages": page_count})
+    try:
+        cache_put(LATEX_CACHE_DIR, cache_key, data.encode('utf-8'), LATEX_CACHE_MAX_BYTES)
+    except OSError as e:
+        logger.warning(f"CACHE: Could not write LaTeX cache: {e}")
+
+
+def _compile_with_fixes(
+    latex_source: str,
+    api_key: str,
+    compile_dir: Path
+) -> Tuple[Dict, str, int]:
+    """
+    Stage 3: compile the LaTeX, asking Gemini to fix errors on failure.
+
+    Returns:
+        (last compile_latex() result, LaTeX source it was compiled from,
+         number of fix attempts made)
+    """
+    logger.info(f"STAGE 3 START: Compiling initial LaTeX")
+    result = compile_latex(latex_source, output_dir=compile_dir)
+
+    # Retry up to MAX_FIX_RETRIES times if compilation fails
+    retry_count = 0
+
+    while not result["success"] and retry_count < MAX_FIX_RETRIES:
+        retry_count += 1
+        logger.warning(f"STAGE 3: Compilation failed (attempt {retry_count}/{MAX_FIX_RETRIES})")
+        if result["errors"]:
+            logger.error(f"STAGE 3: First 3 errors: {result['errors'][:3]}")
+
+        try:
+            logger.info(f"STAGE 3: Asking Gemini to fix errors (retry {retry_count}/{MAX_FIX_RETRIES})...")
+            latex_source = fix_latex_errors(
+                latex_source,
+                result["errors"],
+                result["log"],
+                api_key
+            )
+            logger.info(f"STAGE 3: Received fixed LaTeX, recompiling...")
+
+            # Try compiling the fixed version
+            result = compile_latex(latex_source, output_dir=compile_dir)
+
+            if result["success"]:
+                logger.info(f"STAGE 3: Fixed LaTeX compiled successfully on retry {retry_count}")
+                break
+        except Exception as e:
+            logger.error(f"STAGE 3: Error fixing LaTeX on retry {retry_count}: {e}")
+            # Continue to next retry or fail
+
+    return result, latex_source, retry_count
+
+
+def _condense(
+    result: Dict,
+    latex_source: str,
+    api_key: str,
+    compile_dir: Path
+) -> Tuple[Dict, str]:
+    """
+    Stage 4: condense a successful compile to 2 pages if it ran longer.
+
+    Falls back to the given result if condensation fails.
+
+    Returns:
+        (compile_latex() result to use, its LaTeX source)
+    """
+    actual_pages = result["page_count"]
+    logger.info(f"STAGE 3 COMPLETE: Initial compilation succeeded with {actual_pages} page(s)")
+
+    if actual_pages > 2:
+        logger.info(f"STAGE 4 START: Condensing {actual_pages} pages down to 2 pages...")
+        # The recompile overwrites cheatsheet.pdf, so set the original aside
+        # in case the condensed version fails
+        original_pdf = compile_dir / 'original.pdf'
+        os.replace(result["pdf_path"], original_pdf)
+        condensed = False
+
+        try:
+            condensed_source = condense_to_two_pages(latex_source, actual_pages, api_key)
+            logger.info(f"STAGE 4: Received condensed LaTeX, recompiling...")
+
+            # Recompile condensed version
+            condensed_result = compile_latex(condensed_source, output_dir=compile_dir)
+
+            if condensed_result["success"]:
+                result, latex_source = condensed_result, condensed_source
+                condensed = True
+                final_pages = result["page_count"]
+                logger.info(f"STAGE 4 COMPLETE: Condensed to {final_pages} page(s)")
+            else:
+                # Keep the original, which already compiled successfully
+                logger.warning(f"STAGE 4: Condensed version failed to compile, using original")
+
+        except Exception as e:
+            logger.error(f"STAGE 4 FAILED: Condensation error: {e}")
+            logger.info(f"STAGE 4: Using original {actual_pages}-page version")
+
+        if condensed:
+            original_pdf.unlink(missing_ok=True)
+        else:
+            # Put the original back where the caller expects the output
+            os.replace(original_pdf, result["pdf_path"])
+
+    return result, latex_source
+
 
 def generate_cheatsheet(
-    pdf_files: List[bytes],
+    pdf_files: List[PdfSource],
     filenames: List[str],
     api_key: str = API_KEY,
     output_dir: Path = None
@@ -39,7 +413,8 @@ def generate_cheatsheet(
     Complete pipeline: PDFs → 2-page LaTeX cheat sheet.
 
     Args:
-        pdf_files: List of PDF file bytes (up to 10 recommended)
+        pdf_files: List of PDFs as bytes, paths, or binary file-like objects
+            (up to 10 recommended)
         filenames: Corresponding filenames for context
         api_key: Gemini API key
         output_dir: Optional directory to save outputs
@@ -47,8 +422,7 @@ def generate_cheatsheet(
     Returns:
         {
             "success": bool,
-            "pdf_bytes": bytes | None,
-            "pdf_path": str | None,
+            "pdf_path": str | None,  # temp file owned by the caller unless output_dir is set
             "latex_source": str,
             "tex_path": str | None,
             "metadata": {
@@ -61,31 +435,20 @@ def generate_cheatsheet(
         }
     """
     start_time = time.time()
-    logger.info(f"STAGE 1 START: Converting {len(pdf_files)} PDFs to images...")
 
-    # Stage 1: Convert all PDFs to images
-    all_images = []
-    page_count = 0
+    # Re-submitting the same PDFs reuses the LaTeX from the last successful run
+    cache_key = _latex_cache_key(pdf_files)
+    cached = _load_cached_latex(cache_key)
 
-    for i, pdf_bytes in enumerate(pdf_files):
-        logger.info(f"STAGE 1: Converting PDF {i+1}/{len(pdf_files)} ({len(pdf_bytes)} bytes)")
-        images = pdf_to_images(pdf_bytes)
-        all_images.extend(images)
-        page_count += len(images)
-        logger.info(f"STAGE 1: PDF {i+1} converted to {len(images)} pages")
-
-    logger.info(f"STAGE 1 COMPLETE: Converted {page_count} total pages from {len(pdf_files)} PDFs")
+    if cached:
+        latex_source, page_count = cached
+        logger.info(f"STAGES 1-2 SKIPPED: Reusing cached LaTeX ({len(latex_source)} characters)")
+    else:
+        latex_source, page_count = _render_and_generate(pdf_files, filenames, api_key)
 
-    # Stage 2: Single Gemini call to generate comprehensive LaTeX
-    logger.info(f"STAGE 2 START: Calling Gemini API with {len(all_images)} images")
-    try:
-        latex_source = gemini_generate_latex(all_images, filenames, api_key)
-        logger.info(f"STAGE 2 COMPLETE: Received {len(latex_source)} characters of LaTeX")
-    except Exception as e:
-        logger.error(f"STAGE 2 FAILED")
+    if latex_source is None:
         return {
             "success": False,
-            "pdf_bytes": None,
             "pdf_path": None,
             "latex_source": "",
             "tex_path": None,
@@ -99,52 +462,33 @@ def generate_cheatsheet(
             }
         }
 
-    # Stage 3: Compile initial version with retry logic
-    logger.info(f"STAGE 3 START: Compiling initial LaTeX")
-    result = compile_latex(latex_source, output_dir=output_dir)
-
-    # Retry up to 3 times if compilation fails
-    max_retries = 3
-    retry_count = 0
-
-    while not result["success"] and retry_count < max_retries:
-        retry_count += 1
-        logger.warning(f"STAGE 3: Compilation failed (attempt {retry_count}/{max_retries})")
-        if result["errors"]:
-            logger.error(f"STAGE 3: First 3 errors: {result['errors'][:3]}")
-
-        try:
-            logger.info(f"STAGE 3: Asking Gemini to fix errors (retry {retry_count}/{max_retries})...")
-            latex_source = fix_latex_errors(
-                latex_source,
-                result["errors"],
-                result["log"],
-                api_key
-            )
-            logger.info(f"STAGE 3: Received fixed LaTeX, recompiling...")
+    # Stages 3-4 share one scratch directory so pdflatex's aux files carry
+    # over from the initial compile to the condensed one
+    with tempfile.TemporaryDirectory(prefix='cramify_') as work_dir:
+        compile_dir = output_dir or Path(work_dir)
+        result, latex_source, retry_count = _compile_with_fixes(latex_source, api_key, compile_dir)
+        if result["success"]:
+            result, latex_source = _condense(result, latex_source, api_key, compile_dir)
 
-            # Try compiling the fixed version
-            result = compile_latex(latex_source, output_dir=output_dir)
-
-            if result["success"]:
-                logger.info(f"STAGE 3: Fixed LaTeX compiled successfully on retry {retry_count}")
-                break
-        except Exception as e:
-            logger.error(f"STAGE 3: Error fixing LaTeX on retry {retry_count}: {e}")
-            # Continue to next retry or fail
+            if output_dir is None:
+                # Move the PDF out before the scratch directory is removed; the
+                # caller streams it from disk and deletes it afterwards
+                fd, pdf_path = tempfile.mkstemp(suffix=".pdf")
+                os.close(fd)
+                shutil.move(result["pdf_path"], pdf_path)
+                result = {**result, "pdf_path": pdf_path}
 
     if not result["success"]:
         elapsed = time.time() - start_time
-        logger.error(f"STAGE 3 FAILED: Compilation failed after {max_retries} retries and {elapsed:.1f}s")
+        logger.error(f"STAGE 3 FAILED: Compilation failed after {MAX_FIX_RETRIES} retries and {elapsed:.1f}s")
         if result["errors"]:
             logger.error(f"STAGE 3: Final errors: {result['errors'][:3]}")
         return {
             "success": False,
-            "pdf_bytes": None,
             "pdf_path": None,
             "latex_source": latex_source,
             "tex_path": result["tex_path"],
-            "error": f"LaTeX compilation failed after {max_retries} fix attempts",
+            "error": f"LaTeX compilation failed after {MAX_FIX_RETRIES} fix attempts",
             "metadata": {
                 "input_pdfs": len(pdf_files),
                 "total_pages": page_count,
@@ -155,36 +499,15 @@ def generate_cheatsheet(
             }
         }
 
-    # Stage 4: Check page count and condense if needed
-    actual_pages = result["page_count"]
-    logger.info(f"STAGE 3 COMPLETE: Initial compilation succeeded with {actual_pages} page(s)")
-
-    if actual_pages > 2:
-        logger.info(f"STAGE 4 START: Condensing {actual_pages} pages down to 2 pages...")
-        try:
-            latex_source = condense_to_two_pages(latex_source, actual_pages, api_key)
-            logger.info(f"STAGE 4: Received condensed LaTeX, recompiling...")
-
-            # Recompile condensed version
-            result = compile_latex(latex_source, output_dir=output_dir)
-
-            if result["success"]:
-                final_pages = result["page_count"]
-                logger.info(f"STAGE 4 COMPLETE: Condensed to {final_pages} page(s)")
-            else:
-                logger.warning(f"STAGE 4: Condensed version failed to compile, using original")
-                # Fall back to original if condensation fails
-                result = compile_latex(latex_source, output_dir=output_dir)
-
-        except Exception as e:
-            logger.error(f"STAGE 4 FAILED: Condensation error: {e}")
-            logger.info(f"STAGE 4: Using original {actual_pages}-page version")
-
     elapsed = time.time() - start_time
+    pdf_path = None
 
     if result["success"]:
+        pdf_path = result["pdf_path"]
+        _store_cached_latex(cache_key, latex_source, page_count)
+
         final_pages = result["page_count"]
-        pdf_size = len(result["pdf_bytes"]) if result["pdf_bytes"] else 0
+        pdf_size = os.path.getsize(pdf_path)
         logger.info(f"FINAL SUCCESS: Generated cheat sheet in {elapsed:.1f}s ({final_pages} pages, {pdf_size} bytes)")
         if final_pages != 2:
             logger.warning(f"FINAL: Output is {final_pages} pages (target was 2)")
@@ -193,8 +516,7 @@ def generate_cheatsheet(
 
     return {
         "success": result["success"],
-        "pdf_bytes": result["pdf_bytes"],
-        "pdf_path": result["pdf_path"],
+        "pdf_path": pdf_path,
         "latex_source": latex_source,
         "tex_path": result["tex_path"],
         "metadata": {
@@ -231,7 +553,7 @@ def generate_from_paths(
         if not pdf_path.exists():
             raise FileNotFoundError(f"PDF not found: {path}")
 
-        pdf_files.append(pdf_path.read_bytes())
+        pdf_files.append(pdf_path)
         filenames.append(pdf_path.name)
 
     output_path = Path(output_dir)
@@ -243,44 +565,42 @@ def generate_from_paths(
     if result["latex_source"]:
         tex_output = output_path / "cheatsheet.tex"
         tex_output.write_text(result["latex_source"], encoding='utf-8')
-        print(f" Saved LaTeX source: {tex_output}")
+        logger.info(f"Saved LaTeX source: {tex_output}")
 
     return result
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
     if len(sys.argv) < 2:
-        print("Usage: python latex_pipeline.py <pdf1> [pdf2] [pdf3] ...")
-        print("\nExample:")
-        print("  python latex_pipeline.py lecture1.pdf lecture2.pdf lecture3.pdf")
+        # Run as a module (from backend/) so the relative .latex import resolves
+        logger.error("Usage: python -m app.cheatsheet_pipeline <pdf1> [pdf2] [pdf3] ...")
+        logger.error("\nExample:")
+        logger.error("  python -m app.cheatsheet_pipeline lecture1.pdf lecture2.pdf lecture3.pdf")
         sys.exit(1)
 
     pdf_paths = sys.argv[1:]
 
-    print(f" Cramify LaTeX Pipeline")
-    print(f"   Processing {len(pdf_paths)} PDF(s)")
-    print()
+    logger.info(f" Cramify LaTeX Pipeline")
+    logger.info(f"   Processing {len(pdf_paths)} PDF(s)\n")
 
     try:
         result = generate_from_paths(pdf_paths)
 
         if result["success"]:
-            print()
-            print(f" Summary:")
-            print(f" Input PDFs: {result['metadata']['input_pdfs']}")
-            print(f" Input pages: {result['metadata']['total_pages']}")
-            print(f" Output pages: {result['metadata']['output_pages']}")
-            print(f" Time: {result['metadata']['processing_time_sec']:.1f}s")
-            print(f" Output: {result['pdf_path']}")
+            logger.info(f"\n Summary:")
+            logger.info(f" Input PDFs: {result['metadata']['input_pdfs']}")
+            logger.info(f" Input pages: {result['metadata']['total_pages']}")
+            logger.info(f" Output pages: {result['metadata']['output_pages']}")
+            logger.info(f" Time: {result['metadata']['processing_time_sec']:.1f}s")
+            logger.info(f" Output: {result['pdf_path']}")
         else:
-            print()
-            print(f" Failed to generate cheat sheet")
+            logger.error(f"\n Failed to generate cheat sheet")
             if "error" in result:
-                print(f"   Error: {result['error']}")
+                logger.error(f"   Error: {result['error']}")
             sys.exit(1)
 
     except Exception as e:
-        print(f" Error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f" Error: {e}")
         sys.exit(1)
@@ -1,14 +1,45 @@
-from .pdf_processing import pdf_to_images
-from .gemini_client import gemini_generate_latex, condense_to_two_pages, fix_latex_errors
-from .compiler import compile_latex, count_pdf_pages
-from .utils import sanitize_latex
+from ..pdf_processing import (
+    InvalidPdfError,
+    PdfSource,
+    iter_document_images,
+    iter_pdf_images,
+    open_pdf,
+    pdf_digest,
+    pdf_to_images,
+    read_pdf_bytes,
+    render_pages,
+)
+from .gemini_client import (
+    upload_image,
+    gemini_generate_latex,
+    merge_latex_fragments,
+    condense_to_two_pages,
+    fix_latex_errors,
+)
+from .compiler import build_preamble_format, compile_latex, count_pdf_pages, warm_tectonic_cache
+from .utils import sanitize_latex_to_bytes
+from .cache import cache_get, cache_put
 
 __all__ = [
+    'InvalidPdfError',
+    'PdfSource',
+    'iter_document_images',
+    'iter_pdf_images',
+    'open_pdf',
+    'pdf_digest',
     'pdf_to_images',
+    'read_pdf_bytes',
+    'render_pages',
+    'upload_image',
     'gemini_generate_latex',
+    'merge_latex_fragments',
     'condense_to_two_pages',
     'fix_latex_errors',
+    'build_preamble_format',
     'compile_latex',
     'count_pdf_pages',
-    'sanitize_latex',
+    'warm_tectonic_cache',
+    'sanitize_latex_to_bytes',
+    'cache_get',
+    'cache_put',
 ]
@@ -0,0 +1,85 @@
+"""
+On-disk cache helpers.
+
+A small content-addressed file cache: each entry is one file named by its
+key, written atomically, and evicted least-recently-used once the cache
+directory grows past its size limit.
+"""
+
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+
+def cache_get(cache_dir: Path, key: str) -> Optional[bytes]:
+    """
+    Read a cache entry.
+
+    Args:
+        cache_dir: Cache directory
+        key: Entry key (used as the filename)
+
+    Returns:
+        Cached bytes, or None on a miss
+    """
+    path = cache_dir / key
+    try:
+        data = path.read_bytes()
+        os.utime(path)  # Mark as recently used for LRU eviction
+    except FileNotFoundError:
+        return None
+    return data
+
+
+def cache_put(cache_dir: Path, key: str, data: bytes, max_bytes: int) -> None:
+    """
+    Atomically write a cache entry, then evict old entries over the size limit.
+
+    Args:
+        cache_dir: Cache directory (created if missing)
+        key: Entry key (used as the filename)
+        data: Bytes to store
+        max_bytes: Size limit for the whole cache directory
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    # Write to a temp file first so readers never see a partial entry
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, cache_dir / key)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    _evict_lru(cache_dir, max_bytes)
+
+
+def _evict_lru(cache_dir: Path, max_bytes: int) -> None:
+    """Delete least-recently-used entries until the directory fits in max_bytes."""
+    entries = []
+    total = 0
+
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith('.tmp'):
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total += stat.st_size
+
+    if total <= max_bytes:
+        return
+
+    for _, size, path in sorted(entries):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        if total <= max_bytes:
+            break
@@ -1,16 +1,424 @@
+import os
 import re
+import time
+import shutil
+import signal
+import hashlib
+import logging
 import subprocess
 import tempfile
+import threading
+from collections import deque
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
-from .utils import sanitize_latex
-from .pdf_processing import count_pdf_pages
+from .cache import cache_get, cache_put
+from .utils import sanitize_latex_to_bytes
+from .prompts import LATEX_PREAMBLE
+from ..pdf_processing import count_pdf_pages
 
-# Compile LaTeX source to PDF using latexmk
+logger = logging.getLogger(__name__)
+
+
+def _pdflatex_version() -> str:
+    """First line of `pdflatex --version`, or "" if pdflatex can't be run."""
+    try:
+        result = subprocess.run(
+            ['pdflatex', '--version'],
+            capture_output=True,
+            text=True,
+            timeout=10
+        )
+    except (OSError, subprocess.SubprocessError):
+        return ""
+    return result.stdout.partition('\n')[0]
+
+
+# The standard preamble is precompiled into a pdflatex format with
+# mylatexformat, so compiles skip re-loading its packages every time. The
+# format is cached across restarts and named by a hash of the preamble and
+# the engine version, so editing the preamble or upgrading TeX Live never
+# loads a stale format (pdftex refuses formats from another build).
+FORMAT_NAME = "cramify-preamble-" + hashlib.sha256(
+    (LATEX_PREAMBLE + _pdflatex_version()).encode('utf-8')
+).hexdigest()[:12]
+FORMAT_DIR = Path(os.getenv('XDG_CACHE_HOME') or Path.home() / '.cache') / 'cramify'
+_PREAMBLE_LINES = [line.strip() for line in LATEX_PREAMBLE.encode('utf-8').splitlines()]
+_format_ready: Optional[bool] = None  # None until a build has been attempted
+
+# tectonic (a self-contained XeTeX engine that caches its own formats and
+# packages) is used when installed; pdflatex remains the fallback
+TECTONIC = shutil.which('tectonic')
+TECTONIC_CACHE_DIR = Path(os.getenv('TECTONIC_CACHE_DIR', Path(tempfile.gettempdir()) / 'cramify-tectonic'))
+
+# Compiler output is scanned as it streams; only the last few "! " error
+# lines and the tail of the log are kept
+COMPILE_TIMEOUT = 30  # seconds per compiler run
+MAX_ERROR_LINES = 20
+LOG_TAIL_LINES = 200
+
+# Unescaped % to end of line, stripped by the aggressive retry
+_COMMENT_RE = re.compile(rb'(?<!\\)%[^\n]*')
+_NON_ASCII_BYTES = bytes(range(0x80, 0x100))
+
+# PDFs from successful compiles, keyed by a hash of the exact source and
+# command line, so fix/condense rounds that converge skip compilation entirely
+COMPILE_CACHE_DIR = Path(tempfile.gettempdir()) / 'cramify_latex_cache'
+COMPILE_CACHE_MAX_BYTES = 500 * 1024 * 1024
+
+# Each request thread remembers its last successful compile (cache key, PDF
+# bytes, page count), so a condense round that returns unchanged source
+# skips both the disk cache and re-counting pages
+_last_compile = threading.local()
+
+# Per-compile scratch directories; any older than ORPHAN_TEMP_DIR_AGE were
+# left behind by a crashed process and are removed at import
+TEMP_DIR_PREFIX = 'cramify_'
+ORPHAN_TEMP_DIR_AGE = 3600  # seconds
+
+
+def _remove_orphan_temp_dirs() -> None:
+    """Delete stale cramify_* scratch directories from earlier crashed runs."""
+    cutoff = time.time() - ORPHAN_TEMP_DIR_AGE
+    try:
+        entries = list(os.scandir(tempfile.gettempdir()))
+    except OSError:
+        return
+
+    for entry in entries:
+        # The compile cache shares the prefix but is meant to persist
+        if not entry.name.startswith(TEMP_DIR_PREFIX) or entry.path == str(COMPILE_CACHE_DIR):
+            continue
+        try:
+            if entry.is_dir(follow_symlinks=False) and entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                logger.info(f"Removed orphaned scratch directory {entry.path}")
+        except OSError:
+            continue
+
+
+_remove_orphan_temp_dirs()
+
+
+def build_preamble_format() -> bool:
+    """
+    Precompile the standard cheat-sheet preamble into a pdflatex format file.
+
+    Reuses a format already cached in FORMAT_DIR. Safe to run from several
+    processes at once: each builds in its own scratch directory and
+    atomically replaces the shared format file.
+
+    Returns:
+        True if compile_latex() can use the format
+    """
+    global _format_ready
+
+    if (FORMAT_DIR / f'{FORMAT_NAME}.fmt').exists():
+        logger.info(f"Using cached preamble format in {FORMAT_DIR}")
+        _format_ready = True
+        return _format_ready
+
+    build_dir = None
+    try:
+        FORMAT_DIR.mkdir(parents=True, exist_ok=True)
+        build_dir = Path(tempfile.mkdtemp(dir=FORMAT_DIR))
+        (build_dir / f'{FORMAT_NAME}.tex').write_text(
+            LATEX_PREAMBLE + '\\begin{document}\n\\end{document}\n', encoding='utf-8'
+        )
+        subprocess.run(
+            [
+                'pdflatex',
+                '-ini',
+                '-interaction=nonstopmode',
+                '-no-shell-escape',
+                f'-jobname={FORMAT_NAME}',
+                '&pdflatex',
+                'mylatexformat.ltx',
+                f'{FORMAT_NAME}.tex'
+            ],
+            cwd=build_dir,
+            capture_output=True,
+            text=True,
+            timeout=60,
+            check=True  # nonstopmode still dumps a format after errors; never cache one
+        )
+        os.replace(build_dir / f'{FORMAT_NAME}.fmt', FORMAT_DIR / f'{FORMAT_NAME}.fmt')
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"Preamble format unavailable, compiling without it: {e}")
+        _format_ready = False
+    else:
+        logger.info(f"Built preamble format in {FORMAT_DIR}")
+        _format_ready = True
+    finally:
+        if build_dir is not None:
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+    return _format_ready
+
+
+def warm_tectonic_cache() -> bool:
+    """
+    Compile the standard preamble once with tectonic so its packages are cached.
+
+    tectonic downloads packages on first use, which would otherwise blow the
+    per-compile timeout on the first request after a deploy.
+
+    Returns:
+        True if tectonic is installed and compiled the preamble
+    """
+    if TECTONIC is None:
+        return False
+
+    with tempfile.TemporaryDirectory(prefix=TEMP_DIR_PREFIX) as build_dir:
+        (Path(build_dir) / 'cheatsheet.tex').write_text(
+            LATEX_PREAMBLE + '\\begin{document}\nx\n\\end{document}\n', encoding='utf-8'
+        )
+        try:
+            result = subprocess.run(
+                _tectonic_command(),
+                cwd=build_dir,
+                env=_tectonic_env(),
+                capture_output=True,
+                text=True,
+                timeout=300
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning(f"Could not warm the tectonic cache: {e}")
+            return False
+
+    if result.returncode != 0:
+        logger.warning(f"Could not warm the tectonic cache: {result.stderr[-500:]}")
+        return False
+
+    logger.info(f"Warmed tectonic cache in {TECTONIC_CACHE_DIR}")
+    return True
+
+
+def _apply_preamble_format(latex_source: bytes) -> Tuple[bytes, bool]:
+    """
+    Mark where the precompiled preamble ends so pdflatex can skip it.
+
+    Only documents that start with the standard preamble (ignoring
+    whitespace around each line) use the format; anything else compiles
+    from scratch.
+
+    Returns:
+        (UTF-8 LaTeX source, whether to compile with the format)
+    """
+    # tectonic can't load a pdflatex format
+    if TECTONIC:
+        return latex_source, False
+
+    if _format_ready is None:
+        build_preamble_format()
+    if not _format_ready:
+        return latex_source, False
+
+    lines = latex_source.splitlines(keepends=True)
+    preamble_len = len(_PREAMBLE_LINES)
+    if [line.strip() for line in lines[:preamble_len]] != _PREAMBLE_LINES:
+        return latex_source, False
+
+    # mylatexformat skips everything before \endofdump when the format is loaded
+    return b''.join(lines[:preamble_len]) + b'\\endofdump\n' + b''.join(lines[preamble_len:]), True
+
+
+def _pdflatex_command(use_format: bool, draft: bool = False) -> List[str]:
+    """Build the pdflatex command line, optionally loading the preamble format."""
+    command = [
+        'pdflatex',
+        '-halt-on-error',
+        '-interaction=nonstopmode',
+        '-no-shell-escape',  # Security: disable shell access
+    ]
+    if draft:
+        command.append('-draftmode')  # Check for errors without writing the PDF
+    if use_format:
+        command.append(f'-fmt={FORMAT_NAME}')
+    return command + ['cheatsheet.tex']
+
+
+def _latex_env(use_format: bool) -> Optional[Dict[str, str]]:
+    """Environment for pdflatex; adds FORMAT_DIR to the format search path."""
+    if not use_format:
+        return None
+    # The trailing separator keeps kpathsea's default search path
+    return {**os.environ, 'TEXFORMATS': f'{FORMAT_DIR}{os.pathsep}'}
+
+
+def _tectonic_command() -> List[str]:
+    """Build the tectonic command line (shell escape is off by default)."""
+    return [
+        TECTONIC,
+        '-X', 'compile',
+        '--keep-logs',
+        '--outdir', '.',
+        '--chatter', 'minimal',
+        'cheatsheet.tex'
+    ]
+
+
+def _tectonic_env() -> Dict[str, str]:
+    """Environment for tectonic; keeps its package cache in TECTONIC_CACHE_DIR."""
+    return {**os.environ, 'TECTONIC_CACHE_DIR': str(TECTONIC_CACHE_DIR)}
+
+
+def _compile_command(use_format: bool) -> List[str]:
+    """The command line that _run_latex() tries first."""
+    return _tectonic_command() if TECTONIC else _pdflatex_command(use_format)
+
+
+class _CompilerRun(NamedTuple):
+    """Outcome of one compiler run."""
+    returncode: int
+    log: str  # Tail of the combined stdout/stderr
+    errors: List[str]  # Last "! " error lines
+    timed_out: bool
+
+
+def _run_compiler(command: List[str], cwd: str, env: Optional[Dict[str, str]]) -> _CompilerRun:
+    """
+    Run a LaTeX compiler, scanning its output line by line as it streams.
+
+    Only the "! " error lines and the last LOG_TAIL_LINES lines are kept,
+    so a long log is never buffered or split all at once. The compiler runs
+    in its own process group, which is killed if it runs longer than
+    COMPILE_TIMEOUT; helpers it spawns (e.g. mktextfm) would otherwise keep
+    the output pipe open and the read blocked.
+
+    Returns:
+        The finished run
+    """
+    errors = deque(maxlen=MAX_ERROR_LINES)
+    tail = deque(maxlen=LOG_TAIL_LINES)
+    timed_out = threading.Event()
+
+    with subprocess.Popen(
+        command,
+        cwd=cwd,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        errors='replace',
+        start_new_session=True
+    ) as proc:
+        def _kill_group():
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+        def _kill():
+            timed_out.set()
+            _kill_group()
+
+        timer = threading.Timer(COMPILE_TIMEOUT, _kill)
+        timer.start()
+        try:
+            for line in proc.stdout:
+                if line.startswith('! '):
+                    errors.append(line.rstrip('\n'))
+                tail.append(line)
+            returncode = proc.wait()
+        except BaseException:
+            _kill_group()
+            raise
+        finally:
+            timer.cancel()
+
+    log = ''.join(tail)
+    if timed_out.is_set():
+        log = f"TIMEOUT after {COMPILE_TIMEOUT} seconds\n{log}"
+    return _CompilerRun(returncode, log, list(errors), timed_out.is_set())
+
+
+def _run_latex(tmpdir: str, use_format: bool) -> _CompilerRun:
+    """
+    Compile cheatsheet.tex with tectonic if installed, otherwise pdflatex.
+
+    If tectonic fails, pdflatex gets a go too: it may still succeed, and
+    otherwise its "! " error lines are what the Gemini fix loop expects.
+
+    Returns:
+        The last compiler run
+    """
+    if TECTONIC:
+        result = _run_compiler(_tectonic_command(), tmpdir, _tectonic_env())
+        if result.returncode == 0 or result.timed_out:
+            return result
+        logger.warning("tectonic failed, falling back to pdflatex")
+
+    return _run_pdflatex(tmpdir, use_format)
+
+
+def _run_pdflatex(tmpdir: str, use_format: bool) -> _CompilerRun:
+    """
+    Run a cheap -draftmode pass, then the real pass only if the draft succeeded.
+
+    Cheat sheets have no cross-references or bibliography, so one real
+    pass is enough and latexmk's multi-pass convergence isn't needed.
+
+    Returns:
+        The failed draft pass, or the final pass
+    """
+    for draft in (True, False):
+        result = _run_compiler(
+            _pdflatex_command(use_format, draft=draft),
+            tmpdir,
+            _latex_env(use_format)
+        )
+        if result.returncode != 0:
+            break
+    return result
+
+
+def _compile_cache_key(latex_source: bytes, command: List[str]) -> str:
+    """Cache key for compiling this exact source with this command line."""
+    digest = hashlib.sha256(latex_source)
+    digest.update('\0'.join(command).encode('utf-8'))
+    return f"{digest.hexdigest()}.pdf"
+
+
+def _load_cached_pdf(cache_key: str) -> Optional[bytes]:
+    """Look up the PDF from an earlier successful compile."""
+    try:
+        return cache_get(COMPILE_CACHE_DIR, cache_key)
+    except OSError as e:
+        logger.warning(f"Could not read compile cache: {e}")
+        return None
+
+
+def _store_cached_pdf(cache_key: str, pdf_bytes: bytes) -> None:
+    """Remember the PDF from a successful compile."""
+    try:
+        cache_put(COMPILE_CACHE_DIR, cache_key, pdf_bytes, COMPILE_CACHE_MAX_BYTES)
+    except OSError as e:
+        logger.warning(f"Could not write compile cache: {e}")
+
+
+def _load_last_compile(cache_key: str) -> Optional[Tuple[bytes, int]]:
+    """This thread's last successful compile, if it was for the same cache key."""
+    last = getattr(_last_compile, 'result', None)
+    if last is None or last[0] != cache_key:
+        return None
+    return last[1], last[2]
+
+
+def _read_pdf_output(pdf_path: Path) -> Optional[bytes]:
+    """Read the compiled PDF, or None if the compiler didn't produce one."""
+    try:
+        return pdf_path.read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+# Compile LaTeX source to PDF using tectonic or pdflatex
 def compile_latex(latex_source: str, output_dir: Path = None, retry: bool = True) -> Dict:
     """
-    Compile LaTeX source to PDF using latexmk.
+    Compile LaTeX source to PDF using tectonic if installed, otherwise pdflatex.
 
     Args:
         latex_source: Complete LaTeX document source
@@ -20,7 +428,6 @@ def compile_latex(latex_source: str, output_dir: Path = None, retry: bool = True
     Returns:
         {
             "success": bool,
-            "pdf_bytes": bytes | None,
             "pdf_path": str | None,
             "tex_path": str | None,
             "log": str,
@@ -29,53 +436,34 @@ def compile_latex(latex_source: str, output_dir: Path = None, retry: bool = True
         }
     """
     # First sanitization pass
-    latex_source = sanitize_latex(latex_source)
+    latex_source = sanitize_latex_to_bytes(latex_source)
+    latex_source, use_format = _apply_preamble_format(latex_source)
 
-    # Use provided output_dir or create temp
+    # Use provided output_dir or a temp directory removed on exit, even if compilation raises
     if output_dir:
         output_dir.mkdir(parents=True, exist_ok=True)
-        tmpdir = str(output_dir)
-        cleanup = False
+        work_dir_context = nullcontext(str(output_dir))
     else:
-        tmpdir = tempfile.mkdtemp()
-        cleanup = True
+        work_dir_context = tempfile.TemporaryDirectory(prefix=TEMP_DIR_PREFIX)
 
-    try:
-        tex_path = Path(tmpdir) / 'cheatsheet.tex'
-        tex_path.write_text(latex_source, encoding='utf-8')
+    with work_dir_context as tmpdir:
+        work_dir = Path(tmpdir)
+        tex_path = work_dir / 'cheatsheet.tex'
+        pdf_path = work_dir / 'cheatsheet.pdf'
 
-        print(f"Compiling LaTeX...")
+        tex_path.write_bytes(latex_source)
 
-        # Compile with latexmk
-        try:
-            result = subprocess.run(
-                [
-                    'latexmk',
-                    '-pdf',
-                    '-halt-on-error',
-                    '-interaction=nonstopmode',
-                    '-no-shell-escape',  # Security: disable shell access
-                    'cheatsheet.tex'
-                ],
-                cwd=tmpdir,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            log = result.stdout + '\n' + result.stderr
-        except subprocess.TimeoutExpired as e:
-            log = f"TIMEOUT after 30 seconds\nstdout: {e.stdout}\nstderr: {e.stderr}"
-            print(f"Compilation timed out")
-            result = None
+        # output_dir may be reused across compiles; never mistake an earlier PDF for success
+        pdf_path.unlink(missing_ok=True)
 
-        pdf_path = Path(tmpdir) / 'cheatsheet.pdf'
+        cache_key = _compile_cache_key(latex_source, _compile_command(use_format))
 
-        if pdf_path.exists():
-            pdf_bytes = pdf_path.read_bytes()
-            page_count = count_pdf_pages(pdf_bytes)
+        def _success(pdf_bytes: bytes, log: str, page_count: Optional[int] = None) -> Dict:
+            if page_count is None:
+                page_count = count_pdf_pages(pdf_bytes)
+            _last_compile.result = (cache_key, pdf_bytes, page_count)
             return {
                 "success": True,
-                "pdf_bytes": pdf_bytes,
                 "pdf_path": str(pdf_path),
                 "tex_path": str(tex_path),
                 "log": log,
@@ -83,69 +471,59 @@ def compile_latex(latex_source: str, output_dir: Path = None, retry: bool = True
                 "page_count": page_count
             }
 
-        # Parse errors
-        errors = [line for line in log.split('\n') if line.startswith('! ')]
+        last = _load_last_compile(cache_key)
+        if last is not None:
+            logger.info("Source unchanged since last compile, skipping compilation")
+            pdf_path.write_bytes(last[0])
+            return _success(last[0], "", last[1])
+
+        cached_pdf = _load_cached_pdf(cache_key)
+        if cached_pdf is not None:
+            logger.info("Compile cache hit, skipping compilation")
+            pdf_path.write_bytes(cached_pdf)
+            return _success(cached_pdf, "")
+
+        logger.info("Compiling LaTeX...")
+
+        # Compile
+        result = _run_latex(tmpdir, use_format)
+        log = result.log
+        if result.timed_out:
+            logger.warning("Compilation timed out")
+
+        pdf_bytes = None if result.timed_out else _read_pdf_output(pdf_path)
+        if pdf_bytes is not None:
+            _store_cached_pdf(cache_key, pdf_bytes)
+            return _success(pdf_bytes, log)
+
+        errors = result.errors
 
         # Aggressive retry
-        if retry and (errors or result is None):
-            print("First compilation failed, retrying with aggressive sanitization...")
+        if retry and (errors or result.timed_out):
+            logger.warning("First compilation failed, retrying with aggressive sanitization...")
 
-            # Aggressive sanitization: ASCII only + remove comments
-            aggressive = latex_source.encode('ascii', 'ignore').decode('ascii')
-            aggressive = re.sub(r'(?<!\\)%.*$', '', aggressive, flags=re.MULTILINE)
+            # Aggressive sanitization: ASCII only + remove comments. Every byte
+            # of a multi-byte UTF-8 character is >= 0x80, so deleting those
+            # bytes drops exactly the non-ASCII characters.
+            aggressive = _COMMENT_RE.sub(b'', latex_source.translate(None, _NON_ASCII_BYTES))
 
-            tex_path.write_text(aggressive, encoding='utf-8')
+            tex_path.write_bytes(aggressive)
 
-            try:
-                result_retry = subprocess.run(
-                    [
-                        'latexmk',
-                        '-pdf',
-                        '-halt-on-error',
-                        '-interaction=nonstopmode',
-                        '-no-shell-escape',
-                        'cheatsheet.tex'
-                    ],
-                    cwd=tmpdir,
-                    capture_output=True,
-                    text=True,
-                    timeout=30
-                )
-                retry_success = True
-                retry_log = result_retry.stdout + result_retry.stderr
-            except subprocess.TimeoutExpired as e:
-                retry_success = False
-                retry_log = f"RETRY TIMEOUT after 30 seconds\nstdout: {e.stdout or ''}\nstderr: {e.stderr or ''}"
-                print(f"Retry also timed out")
-
-            if retry_success and (Path(tmpdir) / 'cheatsheet.pdf').exists():
-                pdf_bytes = (Path(tmpdir) / 'cheatsheet.pdf').read_bytes()
-                page_count = count_pdf_pages(pdf_bytes)
-                return {
-                    "success": True,
-                    "pdf_bytes": pdf_bytes,
-                    "pdf_path": str(Path(tmpdir) / 'cheatsheet.pdf'),
-                    "tex_path": str(tex_path),
-                    "log": retry_log,
-                    "errors": [],
-                    "page_count": page_count
-                }
+            result_retry = _run_latex(tmpdir, use_format)
+            if result_retry.timed_out:
+                logger.warning("Retry also timed out")
+
+            pdf_bytes = None if result_retry.timed_out else _read_pdf_output(pdf_path)
+            if pdf_bytes is not None:
+                # Cached under the original source, which is what callers pass in again
+                _store_cached_pdf(cache_key, pdf_bytes)
+                return _success(pdf_bytes, result_retry.log)
 
         return {
             "success": False,
-            "pdf_bytes": None,
             "pdf_path": None,
             "tex_path": str(tex_path),
             "log": log,
             "errors": errors,
             "page_count": 0
         }
-
-    finally:
-        # Clean up temp directory if we created it
-        if cleanup:
-            import shutil
-            try:
-                shutil.rmtree(tmpdir)
-            except:
-                pass
@@ -5,32 +5,240 @@ Handles all communication with Gemini AI API.
 """
 
 import os
-import base64
+import re
+import time
+import logging
+import threading
 import requests
-from typing import List
+from requests.adapters import HTTPAdapter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List, Optional, Tuple
 from dotenv import load_dotenv
 
-from .prompts import LATEX_SYSTEM_PROMPT, CONDENSATION_PROMPT_TEMPLATE
+try:
+    import orjson  # Faster JSON encoding/decoding for API payloads
+except ImportError:
+    orjson = None
+
+from ..pdf_processing import IMAGE_MIME_TYPE
+from .prompts import LATEX_SYSTEM_PROMPT, CONDENSATION_PROMPT_TEMPLATE, MERGE_PROMPT_TEMPLATE
 from .utils import clean_gemini_response, validate_latex_completeness
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 API_KEY = os.getenv('GEMINI_API_KEY', '')
 API_URL = os.getenv('MODEL_ENDPOINT', '')
+UPLOAD_URL = os.getenv(
+    'GEMINI_UPLOAD_ENDPOINT',
+    'https://generativelanguage.googleapis.com/upload/v1beta/files'
+)
+
+CACHE_URL = os.getenv(
+    'GEMINI_CACHE_ENDPOINT',
+    'https://generativelanguage.googleapis.com/v1beta/cachedContents'
+)
+
+# Page uploads are independent network I/O, so a few run at once per shard
+MAX_PARALLEL_UPLOADS = 4
+
+# One shard per uploaded PDF, up to the API's file limit
+MAX_SHARDS = 10
+
+# Uploads from every request in the process share this many slots, enough
+# for one request with the most shards to upload at full speed
+MAX_PROCESS_UPLOADS = MAX_PARALLEL_UPLOADS * MAX_SHARDS
+_upload_slots = threading.BoundedSemaphore(MAX_PROCESS_UPLOADS)
+
+# One keep-alive session for every Gemini call, so uploads, retries and the
+# fix/condense rounds reuse TLS connections instead of handshaking each time.
+# Sized for every upload slot plus a generate call per shard, so connections
+# aren't discarded as soon as they are returned.
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=MAX_PROCESS_UPLOADS + MAX_SHARDS))
+
+
+def _post_json(url: str, payload: Dict, timeout: float) -> requests.Response:
+    """POST a JSON payload on the shared session, encoded with orjson when installed."""
+    if orjson is None:
+        return _session.post(url, json=payload, timeout=timeout)
+    return _session.post(
+        url,
+        data=orjson.dumps(payload),
+        headers={"Content-Type": "application/json"},
+        timeout=timeout
+    )
+
+
+def _parse_json(response: requests.Response):
+    """Decode a JSON response body, with orjson when installed."""
+    if orjson is None:
+        return response.json()
+    return orjson.loads(response.content)
+
+# Generation attempts when Gemini returns a blocked or empty response
+MAX_GENERATE_ATTEMPTS = 3
+
+# LATEX_SYSTEM_PROMPT is cached on Gemini's side and shared by the generate
+# and merge calls (fix and condense send no system prompt)
+SYSTEM_PROMPT_CACHE_TTL = 3600  # seconds
+# A payload referencing the cache is reused for a 240s attempt plus hedged
+# retries, so stop handing out a cache well before it can expire mid-request
+SYSTEM_PROMPT_CACHE_MARGIN = 600  # seconds
+_system_prompt_caches: Dict[str, Tuple[Optional[str], float]] = {}  # api_key -> (name, expiry)
+_system_prompt_cache_lock = threading.Lock()
+
+
+def _system_prompt_cache(api_key: str) -> Optional[str]:
+    """
+    Get the Gemini cachedContents entry holding LATEX_SYSTEM_PROMPT.
+
+    Created on first use and recreated shortly before it expires. If
+    creation fails (e.g. the prompt is below the model's minimum cacheable
+    size) the failure is remembered for the same TTL.
+
+    Returns:
+        Cache name like "cachedContents/abc", or None if caching is unavailable
+    """
+    with _system_prompt_cache_lock:
+        cached = _system_prompt_caches.get(api_key)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+
+        # The cache is tied to the model named in MODEL_ENDPOINT
+        model = re.search(r'models/[^/:]+', API_URL)
+        cache_name = None
+
+        if model:
+            try:
+                response = _post_json(
+                    f"{CACHE_URL}?key={api_key}",
+                    {
+                        "model": model.group(0),
+                        "system_instruction": {"parts": [{"text": LATEX_SYSTEM_PROMPT}]},
+                        "ttl": f"{SYSTEM_PROMPT_CACHE_TTL}s"
+                    },
+                    timeout=30
+                )
+                response.raise_for_status()
+                cache_name = _parse_json(response)["name"]
+                logger.info(f"Cached system prompt as {cache_name}")
+            except (requests.RequestException, KeyError, ValueError) as e:
+                logger.warning(f"System prompt caching unavailable, sending it inline: {e}")
+
+        # Refresh early so in-flight requests never reference an expired cache
+        _system_prompt_caches[api_key] = (
+            cache_name, time.monotonic() + SYSTEM_PROMPT_CACHE_TTL - SYSTEM_PROMPT_CACHE_MARGIN
+        )
+        return cache_name
+
+
+def _system_prompt_fields(api_key: str) -> Dict:
+    """Payload fields that give a request LATEX_SYSTEM_PROMPT, cached if possible."""
+    cache_name = _system_prompt_cache(api_key)
+    if cache_name:
+        return {"cached_content": cache_name}
+    return {"system_instruction": {"parts": [{"text": LATEX_SYSTEM_PROMPT}]}}
+
+
+def upload_image(img_bytes: bytes, api_key: str = API_KEY) -> str:
+    """
+    Upload one page image to the Gemini Files API.
+
+    Uploaded files expire on Gemini's side after 48 hours. At most
+    MAX_PROCESS_UPLOADS run at once across the process.
+
+    Args:
+        img_bytes: JPEG image bytes
+        api_key: Gemini API key
+
+    Returns:
+        File URI to reference from a request part
+
+    Raises:
+        requests.HTTPError: If the upload fails
+    """
+    with _upload_slots:
+        response = _session.post(
+            f"{UPLOAD_URL}?key={api_key}",
+            data=img_bytes,
+            headers={
+                "X-Goog-Upload-Protocol": "raw",
+                "Content-Type": IMAGE_MIME_TYPE
+            },
+            timeout=60
+        )
+    response.raise_for_status()
+
+    return _parse_json(response)["file"]["uri"]
+
+
+def _generate_attempt(payload: Dict, api_key: str) -> str:
+    """
+    Make one LaTeX generation request.
+
+    Returns:
+        Complete LaTeX document source
+
+    Raises:
+        requests.HTTPError: If API call fails
+        ValueError: If the response was blocked or empty (worth retrying)
+    """
+    response = _post_json(
+        f"{API_URL}?key={api_key}",
+        payload,
+        timeout=240  # 4 minute timeout for large batches
+    )
+    response.raise_for_status()
+
+    data = _parse_json(response)
+
+    # Check if response was blocked or has unexpected structure
+    if "candidates" not in data or len(data["candidates"]) == 0:
+        raise ValueError("Gemini API error: No candidates in response")
+
+    candidate = data["candidates"][0]
+
+    # Check if content was blocked by safety filters
+    if "content" not in candidate:
+        finish_reason = candidate.get("finishReason", "UNKNOWN")
+        raise ValueError(f"Gemini blocked response. Reason: {finish_reason}")
+
+    # Success. Extract the LaTeX
+    parts = candidate["content"].get("parts", [])
+    if not parts:
+        raise ValueError("Gemini API error: Response has no content parts")
+
+    latex_source = parts[0].get("text", "")
+    if not latex_source:
+        raise ValueError("Gemini API error: Response text is empty")
+
+    # Clean up markdown code fences and validate completeness
+    latex_source = clean_gemini_response(latex_source)
+    return validate_latex_completeness(latex_source)
 
 
 def gemini_generate_latex(
-    images: List[bytes],
+    images: Iterable[bytes],
     filenames: List[str],
-    api_key: str = API_KEY
+    api_key: str = API_KEY,
+    first_page: int = 1
 ) -> str:
     """
     Send all PDF images to Gemini Flash and get back complete LaTeX source.
 
+    Images are consumed lazily and uploaded through the Files API as they
+    arrive (up to MAX_PARALLEL_UPLOADS at once), so callers can pass a
+    generator that is still rendering pages while earlier ones upload.
+    Only the file URIs are kept in memory.
+
     Args:
-        images: List of PNG image bytes (from all PDFs)
+        images: JPEG image bytes (from all PDFs), as a list or iterator
         filenames: Source filenames for context
         api_key: Gemini API key
+        first_page: Number of the first image's page across all source PDFs,
+            used in provenance tags when PDFs are processed separately
 
     Returns:
         Complete LaTeX document source
@@ -42,28 +250,35 @@ def gemini_generate_latex(
     if not api_key:
         raise ValueError("GEMINI_API_KEY not set. Add it to .env or environment variables.")
 
-    # Build request parts
-    parts = []
+    # Build request parts, uploading images in parallel as they arrive
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_UPLOADS) as upload_executor:
+        uploads = []
+        for img_bytes in images:
+            if len(uploads) >= MAX_PARALLEL_UPLOADS:
+                # Bound how many page images wait in memory for an upload slot
+                uploads[-MAX_PARALLEL_UPLOADS].result()
+            uploads.append(upload_executor.submit(upload_image, img_bytes, api_key))
+
+        parts = [
+            {"file_data": {"mime_type": IMAGE_MIME_TYPE, "file_uri": upload.result()}}
+            for upload in uploads
+        ]
+
+    image_count = len(parts)
 
     # Add context about source files
     file_list = "\n".join([f"- {fn}" for fn in set(filenames)])  # Deduplicate filenames
-    parts.append({"text": f"SOURCE FILES:\n{file_list}\n\nNow processing {len(images)} pages from these lecture slides..."})
-
-    # Add all images
-    for img_bytes in images:
-        img_b64 = base64.b64encode(img_bytes).decode('utf-8')
-        parts.append({
-            "inline_data": {
-                "mime_type": "image/png",
-                "data": img_b64
-            }
-        })
+    page_note = ""
+    if first_page > 1:
+        page_note = (
+            f"\n\nThese are pages {first_page}-{first_page + image_count - 1} of the full set of slides; "
+            f"number the provenance tags from {first_page}, not 1."
+        )
+    parts.insert(0, {"text": f"SOURCE FILES:\n{file_list}\n\nNow processing {image_count} pages from these lecture slides...{page_note}"})
 
     # API request payload
     payload = {
-        "system_instruction": {
-            "parts": [{"text": LATEX_SYSTEM_PROMPT}]
-        },
+        **_system_prompt_fields(api_key),
         "contents": [{"role": "user", "parts": parts}],
         "generation_config": {
             "temperature": 0.2,  # Low temperature for consistency
@@ -71,60 +286,97 @@ def gemini_generate_latex(
         }
     }
 
-    print(f"Sending {len(images)} images to Gemini Flash...")
+    logger.info(f"Sending {image_count} images to Gemini Flash...")
 
-    # Retry logic for blocked responses
-    max_retries = 3
-    for attempt in range(max_retries):
-        response = requests.post(
-            f"{API_URL}?key={api_key}",
-            json=payload,
-            timeout=240  # 2 minute timeout for large batches
-        )
-        response.raise_for_status()
+    # The first attempt runs alone; if it is blocked or empty, the remaining
+    # attempts are hedged (run at once) and the first valid response wins
+    try:
+        return _generate_attempt(payload, api_key)
+    except ValueError as e:
+        logger.warning(f"Attempt 1: {e}, retrying with {MAX_GENERATE_ATTEMPTS - 1} concurrent attempts...")
 
-        data = response.json()
+    retry_executor = ThreadPoolExecutor(max_workers=MAX_GENERATE_ATTEMPTS - 1)
+    try:
+        pending = {
+            retry_executor.submit(_generate_attempt, payload, api_key)
+            for _ in range(MAX_GENERATE_ATTEMPTS - 1)
+        }
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for attempt in done:
+                try:
+                    return attempt.result()
+                except (ValueError, requests.RequestException) as e:
+                    last_error = e
+                    logger.warning(f"Retry failed: {e}")
+        raise last_error
+    finally:
+        # Don't wait on a slower attempt once one has won
+        retry_executor.shutdown(wait=False)
+
+
+def merge_latex_fragments(
+    fragments: List[str],
+    api_key: str = API_KEY
+) -> str:
+    """
+    Ask Gemini to merge per-PDF cheat sheets into a single document.
 
-        # Check if response was blocked or has unexpected structure
-        if "candidates" not in data or len(data["candidates"]) == 0:
-            if attempt < max_retries - 1:
-                print(f"Attempt {attempt + 1}: No candidates, retrying...")
-                continue
-            raise ValueError(f"Gemini API error: No candidates after {max_retries} attempts")
+    Args:
+        fragments: Complete LaTeX documents, one per source PDF
+        api_key: Gemini API key
 
-        candidate = data["candidates"][0]
+    Returns:
+        Merged LaTeX document source
 
-        # Check if content was blocked by safety filters
-        if "content" not in candidate:
-            finish_reason = candidate.get("finishReason", "UNKNOWN")
-            if attempt < max_retries - 1:
-                print(f"Attempt {attempt + 1}: Response blocked ({finish_reason}), retrying...")
-                continue
-            raise ValueError(f"Gemini blocked response after {max_retries} attempts. Reason: {finish_reason}")
+    Raises:
+        requests.HTTPError: If API call fails
+        ValueError: If API key is missing
+    """
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY not set.")
+
+    instruction = MERGE_PROMPT_TEMPLATE.format(fragment_count=len(fragments))
+
+    parts = [{"text": instruction}]
+    for i, fragment in enumerate(fragments):
+        parts.append({"text": f"\n\nCHEAT SHEET {i + 1}:\n\n{fragment}"})
+
+    payload = {
+        **_system_prompt_fields(api_key),
+        "contents": [{"role": "user", "parts": parts}],
+        "generation_config": {
+            "temperature": 0.2,
+            "max_output_tokens": 8192,
+        }
+    }
+
+    logger.info(f"Asking Gemini to merge {len(fragments)} cheat sheets...")
 
-        # Success. Extract the LaTeX
-        content = candidate.get("content", {})
-        parts = content.get("parts", [])
+    response = _post_json(
+        f"{API_URL}?key={api_key}",
+        payload,
+        timeout=240
+    )
+    response.raise_for_status()
+
+    data = _parse_json(response)
 
-        if not parts or len(parts) == 0:
-            if attempt < max_retries - 1:
-                print(f"Attempt {attempt + 1}: Empty parts in response, retrying...")
-                continue
-            raise ValueError("Gemini API error: Response has no content parts")
+    # Check for blocked responses
+    if "candidates" not in data or len(data["candidates"]) == 0:
+        raise ValueError("Gemini API error: No candidates in response")
 
-        latex_source = parts[0].get("text", "")
+    candidate = data["candidates"][0]
+    if "content" not in candidate:
+        raise ValueError(f"Gemini blocked response. Reason: {candidate.get('finishReason', 'UNKNOWN')}")
 
-        if not latex_source:
-            if attempt < max_retries - 1:
-                print(f"Attempt {attempt + 1}: Empty text in response, retrying...")
-                continue
-            raise ValueError("Gemini API error: Response text is empty")
+    merged_latex = candidate["content"]["parts"][0]["text"]
 
-        # Clean up markdown code fences and validate completeness
-        latex_source = clean_gemini_response(latex_source)
-        latex_source = validate_latex_completeness(latex_source)
+    # Clean up and validate
+    merged_latex = clean_gemini_response(merged_latex)
+    merged_latex = validate_latex_completeness(merged_latex)
 
-        return latex_source
+    return merged_latex
 
 
 def fix_latex_errors(
@@ -189,16 +441,16 @@ CURRENT LATEX SOURCE:
         }
     }
 
-    print(f"Asking Gemini to fix {len(errors)} LaTeX errors...")
+    logger.info(f"Asking Gemini to fix {len(errors)} LaTeX errors...")
 
-    response = requests.post(
+    response = _post_json(
         f"{API_URL}?key={api_key}",
-        json=payload,
+        payload,
         timeout=240
     )
     response.raise_for_status()
 
-    data = response.json()
+    data = _parse_json(response)
 
     # Check for blocked responses
     if "candidates" not in data or len(data["candidates"]) == 0:
@@ -258,16 +510,16 @@ def condense_to_two_pages(
         }
     }
 
-    print(f"Asking Gemini to condense from {current_pages} pages to 2 pages...")
+    logger.info(f"Asking Gemini to condense from {current_pages} pages to 2 pages...")
 
-    response = requests.post(
+    response = _post_json(
         f"{API_URL}?key={api_key}",
-        json=payload,
+        payload,
         timeout=240
     )
     response.raise_for_status()
 
-    data = response.json()
+    data = _parse_json(response)
     condensed_latex = data["candidates"][0]["content"]["parts"][0]["text"]
 
     # Clean up and validate
@@ -2,6 +2,29 @@
 System prompts and instructions for Gemini AI.
 """
 
+# Fixed preamble every generated cheat sheet starts with. The compiler
+# precompiles it into a pdflatex format file, so keep the two in sync.
+LATEX_PREAMBLE = """\\documentclass[10pt,letterpaper]{article}
+\\usepackage[utf8]{inputenc}
+\\usepackage[T1]{fontenc}
+\\usepackage{lmodern}
+\\usepackage{amsmath,amssymb,mathtools}
+\\usepackage{siunitx}
+\\usepackage[margin=0.5in]{geometry}
+\\usepackage{multicol}
+\\setlength{\\columnsep}{0.15in}
+\\usepackage{enumitem}
+\\setlist{nosep,leftmargin=*}
+\\sloppy
+\\emergencystretch=3em
+\\setlength{\\parindent}{0pt}
+\\setlength{\\parskip}{2pt}
+\\usepackage{titlesec}
+\\titlespacing*{\\section}{0pt}{4pt}{2pt}
+\\titlespacing*{\\subsection}{0pt}{3pt}{1pt}
+"""
+
+
 LATEX_SYSTEM_PROMPT = """You are an expert at creating ultra-dense, 2-page LaTeX cheat sheets from lecture materials.
 
 INPUT: You will receive images from multiple PDF lecture slides/notes (may include typed text, handwritten notes, and mathematical equations).
@@ -58,25 +81,7 @@ YOUR TASK: Create a complete, ready-to-compile LaTeX document that:
 
 PREAMBLE TO USE (copy exactly):
 ```latex
-\\documentclass[10pt,letterpaper]{article}
-\\usepackage[utf8]{inputenc}
-\\usepackage[T1]{fontenc}
-\\usepackage{lmodern}
-\\usepackage{amsmath,amssymb,mathtools}
-\\usepackage{siunitx}
-\\usepackage[margin=0.5in]{geometry}
-\\usepackage{multicol}
-\\setlength{\\columnsep}{0.15in}
-\\usepackage{enumitem}
-\\setlist{nosep,leftmargin=*}
-\\sloppy
-\\emergencystretch=3em
-\\setlength{\\parindent}{0pt}
-\\setlength{\\parskip}{2pt}
-\\usepackage{titlesec}
-\\titlespacing*{\\section}{0pt}{4pt}{2pt}
-\\titlespacing*{\\subsection}{0pt}{3pt}{1pt}
-\\begin{document}
+""" + LATEX_PREAMBLE + """\\begin{document}
 \\begin{multicols}{2}
 \\raggedright
 ```
@@ -87,25 +92,7 @@ Start with \\documentclass and end with \\end{document}.
 
 EXAMPLE OUTPUT STRUCTURE:
 ```latex
-\\documentclass[10pt,letterpaper]{article}
-\\usepackage[utf8]{inputenc}
-\\usepackage[T1]{fontenc}
-\\usepackage{lmodern}
-\\usepackage{amsmath,amssymb,mathtools}
-\\usepackage{siunitx}
-\\usepackage[margin=0.5in]{geometry}
-\\usepackage{multicol}
-\\setlength{\\columnsep}{0.15in}
-\\usepackage{enumitem}
-\\setlist{nosep,leftmargin=*}
-\\sloppy
-\\emergencystretch=3em
-\\setlength{\\parindent}{0pt}
-\\setlength{\\parskip}{2pt}
-\\usepackage{titlesec}
-\\titlespacing*{\\section}{0pt}{4pt}{2pt}
-\\titlespacing*{\\subsection}{0pt}{3pt}{1pt}
-\\begin{document}
+""" + LATEX_PREAMBLE + """\\begin{document}
 \\begin{multicols}{2}
 \\raggedright
 
@@ -177,3 +164,15 @@ CONDENSATION_PROMPT_TEMPLATE = """The current LaTeX cheat sheet is {current_page
 **CRITICAL:** Return the COMPLETE modified LaTeX document (starting with \\documentclass and ending with \\end{{document}}).
 
 The goal is 2 FULL pages of the most valuable content, not 1.5 pages or 2.5 pages."""
+
+
+MERGE_PROMPT_TEMPLATE = """Below are {fragment_count} LaTeX cheat sheets, each generated from a different lecture PDF of the same course. Merge them into ONE cheat sheet.
+
+**Your task:**
+- Combine the content into a single document that uses the preamble template EXACTLY as-is
+- Organize everything under the standard sections: "Key Formulas", "Definitions", "Theorems & Properties", "Core Concepts"
+- Deduplicate: if the same formula, definition, or theorem appears in several sheets, include it ONCE (keep the clearest version)
+- Keep the provenance tags ({{\\tiny p.N}}) from the source sheets exactly as written: page numbers already count across all the PDFs in order, so each tag is unambiguous
+- Aim for approximately 3 pages if there is enough content - DO NOT pad with filler
+
+**CRITICAL:** Return the COMPLETE merged LaTeX document (starting with \\documentclass and ending with \\end{{document}})."""
@@ -4,55 +4,59 @@ Utility functions for LaTeX processing.
 Includes sanitization, validation, and text processing helpers.
 """
 
+import logging
 
-def sanitize_latex(text: str) -> str:
+logger = logging.getLogger(__name__)
+
+
+# Problematic Unicode characters and their LaTeX-safe replacements
+_UNICODE_TABLE = str.maketrans({
+    '\u2019': "'",      # Right single quote
+    '\u201c': '"',      # Left double quote
+    '\u201d': '"',      # Right double quote
+    '\u2013': '--',     # En dash
+    '\u2014': '---',    # Em dash
+    '\xa0': ' ',        # Non-breaking space
+    '\u2026': '...',    # Ellipsis
+    '\u2018': "'",      # Left single quote
+})
+
+
+def sanitize_latex_to_bytes(text: str) -> bytes:
     """
-    Sanitize LaTeX for guaranteed compilation.
+    Sanitize LaTeX for guaranteed compilation and encode it for writing.
 
     Performs:
     - Unicode character replacement
     - Brace balancing
     - Line length management
 
+    Everything after the Unicode replacement works on the UTF-8 bytes,
+    which is what gets written to the .tex file anyway.
+
     Args:
         text: LaTeX source code
 
     Returns:
-        Sanitized LaTeX source
+        Sanitized LaTeX source, UTF-8 encoded
     """
-    # Replace problematic Unicode characters
-    unicode_map = {
-        '\u2019': "'",      # Right single quote
-        '\u201c': '"',      # Left double quote
-        '\u201d': '"',      # Right double quote
-        '\u2013': '--',     # En dash
-        '\u2014': '---',    # Em dash
-        '\xa0': ' ',        # Non-breaking space
-        '\u2026': '...',    # Ellipsis
-        '\u2018': "'",      # Left single quote
-    }
-
-    for old, new in unicode_map.items():
-        text = text.replace(old, new)
-
-    # Balance braces (simple check)
-    def balance_braces(s: str) -> str:
-        open_count = s.count('{')
-        close_count = s.count('}')
-        if open_count > close_count:
-            s += '}' * (open_count - close_count)
-        elif close_count > open_count:
-            # Remove excess closing braces from end
-            excess = close_count - open_count
-            for _ in range(excess):
-                last_close = s.rfind('}')
-                if last_close != -1:
-                    s = s[:last_close] + s[last_close+1:]
-        return s
+    # Replace problematic Unicode characters in a single pass
+    data = text.translate(_UNICODE_TABLE).encode('utf-8')
 
-    text = balance_braces(text)
+    return _balance_braces(data)
 
-    return text
+
+def _balance_braces(s: bytes) -> bytes:
+    """Append missing closing braces, or drop excess ones from the end (simple check)."""
+    open_count = s.count(b'{')
+    close_count = s.count(b'}')
+    if open_count > close_count:
+        s += b'}' * (open_count - close_count)
+    elif close_count > open_count:
+        # Remove the last `excess` closing braces in one pass
+        head, *tails = s.rsplit(b'}', close_count - open_count)
+        s = head + b''.join(tails)
+    return s
 
 
 def validate_latex_completeness(latex_source: str) -> str:
@@ -69,30 +73,32 @@ def validate_latex_completeness(latex_source: str) -> str:
     """
     latex_source = latex_source.strip()
 
-    # Check if document ends properly
-    if not latex_source.endswith(r'\end{document}'):
-        print("Response appears truncated, adding closing tags...")
+    # Common case: the document already ends properly
+    if latex_source.endswith(r'\end{document}'):
+        return latex_source
 
-        # Close any open itemize environments
-        if r'\begin{itemize}' in latex_source:
-            open_count = latex_source.count(r'\begin{itemize}')
-            close_count = latex_source.count(r'\end{itemize}')
-            if open_count > close_count:
-                latex_source += '\n\\end{itemize}'
+    logger.warning("Response appears truncated, adding closing tags...")
 
-        # Close any open enumerate environments
-        if r'\begin{enumerate}' in latex_source:
-            open_count = latex_source.count(r'\begin{enumerate}')
-            close_count = latex_source.count(r'\end{enumerate}')
-            if open_count > close_count:
-                latex_source += '\n\\end{enumerate}'
+    # Close any open itemize environments
+    if r'\begin{itemize}' in latex_source:
+        open_count = latex_source.count(r'\begin{itemize}')
+        close_count = latex_source.count(r'\end{itemize}')
+        if open_count > close_count:
+            latex_source += '\n\\end{itemize}'
 
-        # Close multicols if it's open
-        if r'\begin{multicols}' in latex_source and r'\end{multicols}' not in latex_source:
-            latex_source += '\n\\end{multicols}'
+    # Close any open enumerate environments
+    if r'\begin{enumerate}' in latex_source:
+        open_count = latex_source.count(r'\begin{enumerate}')
+        close_count = latex_source.count(r'\end{enumerate}')
+        if open_count > close_count:
+            latex_source += '\n\\end{enumerate}'
 
-        # Close document
-        latex_source += '\n\\end{document}'
+    # Close multicols if it's open
+    if r'\begin{multicols}' in latex_source and r'\end{multicols}' not in latex_source:
+        latex_source += '\n\\end{multicols}'
+
+    # Close document
+    latex_source += '\n\\end{document}'
 
     return latex_source.strip()
 
@@ -109,6 +115,10 @@ def clean_gemini_response(response_text: str) -> str:
     """
     text = response_text.strip()
 
+    # Common case: a well-formed response with no fence or language tag
+    if not text.startswith(("```", "latex\n")):
+        return text
+
     # Remove markdown code fences if present
     if text.startswith("```"):
         lines = text.split("\n")
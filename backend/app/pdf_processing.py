@@ -0,0 +1,205 @@
+"""
+PDF processing utilities.
+
+Handles conversion of PDF files to images for OCR/vision processing.
+"""
+
+import hashlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Union
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+# Gemini downscales images to roughly 1024px on the long edge, so rendering
+# any larger only costs rasterization time and upload bandwidth
+MAX_IMAGE_SIDE = 1024
+JPEG_QUALITY = 85
+IMAGE_MIME_TYPE = "image/jpeg"  # Format of every rendered page image
+
+# A PDF can be passed around as raw bytes, a filesystem path, or a binary
+# file-like object (e.g. the temp file holding an upload from the API)
+PdfSource = Union[bytes, str, Path, BinaryIO]
+
+
+class InvalidPdfError(ValueError):
+    """Raised when PyMuPDF can't open a PDF (corrupt, or not actually a PDF)."""
+
+
+def read_pdf_bytes(source: PdfSource) -> bytes:
+    """
+    Load the full contents of a PDF source.
+
+    Args:
+        source: PDF bytes, path, or binary file-like object
+
+    Returns:
+        PDF file bytes
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if isinstance(source, (str, Path)):
+        return Path(source).read_bytes()
+    source.seek(0)
+    return source.read()
+
+
+def pdf_digest(source: PdfSource) -> bytes:
+    """
+    Compute the SHA-256 digest of a PDF source.
+
+    Files and file-like objects are hashed in chunks rather than loaded
+    into memory.
+
+    Args:
+        source: PDF bytes, path, or binary file-like object
+
+    Returns:
+        Raw SHA-256 digest
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return hashlib.sha256(source).digest()
+    if isinstance(source, (str, Path)):
+        with open(source, 'rb') as f:
+            return hashlib.file_digest(f, 'sha256').digest()
+    source.seek(0)
+    return hashlib.file_digest(source, 'sha256').digest()
+
+
+@contextmanager
+def open_pdf(pdf_source: PdfSource) -> Iterator["fitz.Document"]:
+    """
+    Open a PDF with PyMuPDF and close it on exit.
+
+    Lets callers count pages and render them from a single parse. Paths
+    are opened in place rather than read into memory.
+
+    Args:
+        pdf_source: PDF bytes, path, or binary file-like object
+
+    Yields:
+        Open PyMuPDF document
+
+    Raises:
+        ImportError: If PyMuPDF is not installed
+        InvalidPdfError: If the PDF can't be opened
+    """
+    if fitz is None:
+        raise ImportError("PyMuPDF not installed. Run: pip install pymupdf")
+
+    try:
+        if isinstance(pdf_source, (str, Path)):
+            doc = fitz.open(str(pdf_source), filetype="pdf")
+        else:
+            doc = fitz.open(stream=read_pdf_bytes(pdf_source), filetype="pdf")
+    except RuntimeError as e:  # PyMuPDF's FileDataError and friends
+        raise InvalidPdfError(str(e)) from e
+    try:
+        yield doc
+    finally:
+        doc.close()
+
+
+def iter_document_images(
+    doc: "fitz.Document",
+    max_side: int = MAX_IMAGE_SIDE,
+    pages: Optional[range] = None
+) -> Iterator[bytes]:
+    """
+    Render pages of an open document to JPEG images one page at a time.
+
+    Args:
+        doc: Document from open_pdf()
+        max_side: Target length in pixels of each page's longest side
+        pages: Page numbers to render (default: all pages)
+
+    Yields:
+        JPEG image bytes for each page, in order
+    """
+    for page_number in range(doc.page_count) if pages is None else pages:
+        page = doc[page_number]
+        zoom = max_side / max(page.rect.width, page.rect.height)
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        yield pix.tobytes("jpeg", jpg_quality=JPEG_QUALITY)
+
+
+def iter_pdf_images(
+    pdf_source: PdfSource,
+    max_side: int = MAX_IMAGE_SIDE,
+    pages: Optional[range] = None
+) -> Iterator[bytes]:
+    """
+    Render PDF pages to JPEG images one page at a time.
+
+    Args:
+        pdf_source: PDF bytes, path, or binary file-like object
+        max_side: Target length in pixels of each page's longest side
+        pages: Page numbers to render (default: all pages)
+
+    Yields:
+        JPEG image bytes for each page, in order
+
+    Raises:
+        ImportError: If PyMuPDF is not installed
+    """
+    with open_pdf(pdf_source) as doc:
+        yield from iter_document_images(doc, max_side, pages)
+
+
+def pdf_to_images(
+    pdf_source: PdfSource,
+    max_side: int = MAX_IMAGE_SIDE,
+    pages: Optional[range] = None
+) -> List[bytes]:
+    """
+    Render PDF pages to JPEG images for OCR.
+
+    Args:
+        pdf_source: PDF bytes, path, or binary file-like object
+        max_side: Target length in pixels of each page's longest side
+        pages: Page numbers to render (default: all pages)
+
+    Returns:
+        List of JPEG image bytes
+
+    Raises:
+        ImportError: If PyMuPDF is not installed
+    """
+    return list(iter_pdf_images(pdf_source, max_side, pages))
+
+
+def render_pages(pdf_source: Union[bytes, str, Path], pages: range) -> List[bytes]:
+    """
+    Render a range of pages at the default size.
+
+    A top-level function so process pools can pickle it; each worker
+    opens its own copy of the document.
+
+    Args:
+        pdf_source: PDF bytes or path
+        pages: Page numbers to render
+
+    Returns:
+        List of JPEG image bytes, in page order
+    """
+    return pdf_to_images(pdf_source, pages=pages)
+
+
+def count_pdf_pages(pdf_bytes: bytes) -> int:
+    """
+    Count the number of pages in a PDF.
+
+    Args:
+        pdf_bytes: PDF file bytes
+
+    Returns:
+        Number of pages
+
+    Raises:
+        ImportError: If PyMuPDF is not installed
+    """
+    with open_pdf(pdf_bytes) as doc:
+        return doc.page_count
@@ -0,0 +1,24 @@
+"""
+Gunicorn configuration for the Cramify API.
+
+Start with: gunicorn -c gunicorn.conf.py app.api:app
+"""
+
+import os
+import multiprocessing
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5001)}"
+
+# Each request spends most of its time waiting on Gemini, so threaded workers
+# let one process overlap that wait with other requests' rendering/compiling
+workers = int(os.getenv('WEB_CONCURRENCY', 2 * multiprocessing.cpu_count() + 1))
+worker_class = "gthread"
+threads = 8
+
+# Import the app (PyMuPDF, Gemini client, preamble format build) once in the
+# master; forked workers share those pages copy-on-write
+preload_app = True
+
+# Gemini calls and LaTeX retries can take several minutes per request
+timeout = 600
+keepalive = 5